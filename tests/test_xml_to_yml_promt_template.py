@@ -0,0 +1,85 @@
+import pytest
+
+from xml_to_yml_promt_template import fix_broken_tags, process_xml_to_yaml, xml_to_dict
+
+
+def test_xml_to_dict_closes_elements_left_open_at_eof():
+    assert xml_to_dict("<prompt><a>hello</a><b>world") == {"a": "hello", "b": "world"}
+
+
+def test_process_xml_to_yaml_keeps_truncated_prompt():
+    assert process_xml_to_yaml("<prompt><a>hello</a><b>world")[1] == "a: hello\nb: world\n"
+
+
+def test_process_xml_to_yaml_keeps_items_under_unclosed_li():
+    xml = "<prompt>‹li><item>one</item><item>two</item>\\\n</prompt>"
+    assert process_xml_to_yaml(xml)[1] == "li:\n  item:\n  - one\n  - two\n"
+
+
+def test_process_xml_to_yaml_does_not_repair_on_warnings(capsys):
+    xml = '<a xmlns="foo"><b><e/></b><c>x</c></a>'
+    fixed_xml, yaml_output = process_xml_to_yaml(xml)
+    assert fixed_xml == xml
+    assert "XML still has issues" not in capsys.readouterr().out
+
+
+def test_fix_broken_tags_accepts_str_and_bytes():
+    assert fix_broken_tags("‹li>x‹/li>") == "<li>x</li>"
+    assert fix_broken_tags("‹li>x‹/li>".encode()) == b"<li>x</li>"
+
+
+def test_scalar_document_ends_with_marker():
+    assert process_xml_to_yaml("<a>text</a>")[1] == "text\n...\n"
+
+
+def test_quoted_scalar_document_has_no_end_marker():
+    assert process_xml_to_yaml("<a>yes</a>")[1] == "'yes'\n"
+    assert process_xml_to_yaml("<a>12</a>")[1] == "'12'\n"
+
+
+def test_multiline_scalar_document_has_no_end_marker():
+    assert process_xml_to_yaml("<a>line1\nline2</a>")[1] == "|-\n  line1\n  line2\n"
+
+
+def test_non_ascii_root_tag_is_not_wrapped():
+    assert process_xml_to_yaml("<é><a>t</a></é>") == ("<é><a>t</a></é>", "a: t\n")
+
+
+def _fast_path_fixed_xml(xml):
+    return process_xml_to_yaml(xml)[0]
+
+
+# Both the full repair and the cheap fixes used by process_xml_to_yaml share these rules
+BACKSLASH_CASES = [
+    ("<a>C:\\dir\\file</a>", "<a>C:\\dir\\file</a>"),
+    ("<a>x\n\\\n</a>", "<a>x\n\n</a>"),
+    ("<a>x\r\n\\\r\n</a>", "<a>x\r\n\r\n</a>"),
+    ("<a>x\r\n\\ \r\n</a>", "<a>x\r\n\r\n</a>"),
+    ("<li>x\\li>", "<li>x</li>"),
+]
+
+
+@pytest.mark.parametrize("fix", [fix_broken_tags, _fast_path_fixed_xml])
+@pytest.mark.parametrize("xml, expected", BACKSLASH_CASES)
+def test_only_stray_backslashes_are_removed(fix, xml, expected):
+    assert fix(xml) == expected
+
+
+def test_bent_bracket_closing_tags_outside_the_old_table_are_repaired():
+    assert fix_broken_tags("<output>x‹/output>") == "<output>x</output>"
+
+
+def test_multi_word_bent_bracket_tag_keeps_its_explicit_fix():
+    assert fix_broken_tags("‹intent taxonomy Instruction>") == "<intent_taxonomy_Instruction>"
+
+
+def test_mismatched_close_is_fixed_on_the_fallback_path():
+    xml = "<a><b>t</c></a>"
+    fixed_xml, yaml_output = process_xml_to_yaml(xml)
+    assert fixed_xml == fix_broken_tags(xml) == "<a><b>t</b></a>"
+    assert yaml_output == "b: t\n"
+
+
+def test_clean_document_is_returned_unchanged():
+    fixed_xml, _ = process_xml_to_yaml("<a><e/></a>")
+    assert fixed_xml == "<a><e/></a>"
@@ -1,9 +1,136 @@
 import re
+import threading
 import yaml
+from collections import defaultdict
 from lxml import etree
 from lxml.etree import XMLSyntaxError
 from io import StringIO
 
+# Prefer the libyaml C emitter when PyYAML was built with it. Only the pure-Python emitter
+# ends a document whose root is a plain scalar with "...", so that marker is requested
+# explicitly in exactly that case (see _ends_open).
+try:
+    from yaml import CSafeDumper as _Dumper
+except ImportError:
+    from yaml import SafeDumper as _Dumper
+
+_STR_TAG = "tag:yaml.org,2002:str"
+_MAP_TAG = "tag:yaml.org,2002:map"
+_SEQ_TAG = "tag:yaml.org,2002:seq"
+_NULL_TAG = "tag:yaml.org,2002:null"
+
+class _PromptDumper(_Dumper):
+    """Dumper that picks the scalar style for the prompt text the conversion produces"""
+
+def _scalar_style(value):
+    # Multi-line prompt text reads best as a literal block where the emitter allows it
+    return "|" if "\n" in value else None
+
+def _represent_str(dumper, value):
+    return dumper.represent_scalar(_STR_TAG, value, style=_scalar_style(value))
+
+_PromptDumper.add_representer(str, _represent_str)
+
+_RESOLVER = yaml.resolver.Resolver()
+_ANALYZER = yaml.emitter.Emitter(StringIO(), allow_unicode=True)
+
+def _ends_open(value):
+    """Whether a root scalar is written plain, which the pure-Python emitter follows with "..."."""
+    if value is None:
+        return True
+    if _scalar_style(value) is not None:
+        return False
+    if _RESOLVER.resolve(yaml.ScalarNode, value, (True, False)) != _STR_TAG:
+        return False
+    return _ANALYZER.analyze_scalar(value).allow_block_plain
+
+# Element whose closing tag may not match its opening tag
+_RE_GENERIC_TAG = re.compile(rb'<([a-zA-Z0-9_]+)([^>]*)>([^<]*)<\/([a-zA-Z0-9_]+)([^>]*)>')
+
+# Content that already starts with an XML declaration or an element (bytes \w is ASCII
+# only, so UTF-8 lead bytes are accepted for non-ASCII tag names)
+_RE_LEADING_TAG = re.compile(rb'\s*<(?:\?xml|[\w\x80-\xff])')
+
+# Incorrect angle bracket, replaced before any tag fixing
+_WRONG_BRACKET = "›".encode()
+
+# Literal tag fixes (as UTF-8 bytes), applied in a single regex pass
+_TAG_FIXES = {bad.encode(): good.encode() for bad, good in {
+    # li tags (other "‹tag>" forms are handled by the bent bracket pattern)
+    "\\li>": "</li>",
+    # Example tags
+    "</ Example>": "</Example>",
+    # system instruction tag
+    "<system instruction>": "<system_instruction>",
+    "</system instruction>": "</system_instruction>",
+    # Task Instruction tag
+    "<Task Instruction>": "<Task_Instruction>",
+    "</Task Instruction>": "</Task_Instruction>",
+    # intent taxonomy tag
+    "‹intent taxonomy Instruction>": "<intent_taxonomy_Instruction>",
+    "</intent taxonomy Instruction>": "</intent_taxonomy_Instruction>",
+    # intent taxonomy list tag
+    "<intent taxonomy list>": "<intent_taxonomy_list>",
+    "</intent taxonomy list>": "</intent_taxonomy_list>",
+    # Other special characters
+    "•..": "",
+}.items()}
+
+# Anything the character-level fixes would act on; clean documents skip them entirely
+_RE_SUSPICIOUS = re.compile("|".join(["›", "‹", "•", r"\\", "</ Example>", "</?(?:system|Task|intent) "]).encode())
+
+def _trie_pattern(words):
+    """Build a regex matching the longest of the given byte strings, factored by common prefix
+    
+    Each position in the input then costs at most one byte comparison per trie level
+    instead of one attempt per word.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for byte in word:
+            node = node.setdefault(byte, {})
+        node[None] = {}
+    
+    def build(node):
+        branches = [re.escape(bytes([byte])) + build(node[byte]) for byte in sorted(b for b in node if b is not None)]
+        if not branches:
+            return b""
+        if len(branches) == 1 and None not in node:
+            return branches[0]
+        # A word ending here is still a match if no longer one does
+        return b"(?:" + b"|".join(branches) + b")" + (b"?" if None in node else b"")
+    
+    return build(trie)
+
+# Known fixes, plus spurious backslashes at the end of a line (backslashes elsewhere
+# may be legitimate content and are left alone) and any single-word tag opened with
+# a bent bracket, e.g. "‹li>" or "‹/Example1>"
+_RE_TAG_FIX = re.compile(_trie_pattern(_TAG_FIXES)
+                         + rb"|(?P<backslash>\\[ \t]*(?=\r?\n|\Z))"
+                         + b"|" + "‹".encode() + rb"(?P<bent>/?\w+)>")
+
+def _fix_closing_tag(m):
+    """Make the closing tag match the opening tag, leaving well-formed elements untouched"""
+    if m.group(1) == m.group(4) and not m.group(5):
+        return m.group(0)
+    return b"<%s%s>%s</%s>" % (m.group(1), m.group(2), m.group(3), m.group(1))
+
+def _fix_known_tag(m):
+    """Replace a known broken tag or character sequence"""
+    if m.lastgroup == "backslash":
+        return b""
+    if m.lastgroup == "bent":
+        return b"<" + m.group("bent") + b">"
+    return _TAG_FIXES[m.group(0)]
+
+def _fix_fast(xml_content):
+    """Apply only the character-level fixes, skipping the generic closing-tag repair"""
+    if not _RE_SUSPICIOUS.search(xml_content):
+        return xml_content
+    xml_content = xml_content.replace(_WRONG_BRACKET, b">")
+    return _RE_TAG_FIX.sub(_fix_known_tag, xml_content)
+
 def fix_broken_tags(xml_content):
     """
     Fix common XML tag issues:
@@ -11,175 +138,300 @@ def fix_broken_tags(xml_content):
     2. Missing closing tags
     3. Mismatched tags
     4. Improperly formatted list items
+    
+    Works on UTF-8 encoded bytes so the result can be handed to lxml without
+    another encoding pass; str input is encoded and the result decoded back to
+    str. This is the full repair: process_xml_to_yaml only falls back to it when
+    the cheaper character-level fixes don't yield valid XML.
     """
+    if isinstance(xml_content, str):
+        return fix_broken_tags(xml_content.encode()).decode()
+    
+    suspicious = _RE_SUSPICIOUS.search(xml_content) is not None
+    
     # Replace incorrect angle brackets
-    xml_content = xml_content.replace("›", ">")
+    if suspicious:
+        xml_content = xml_content.replace(_WRONG_BRACKET, b">")
     
     # Fix common tag errors
-    xml_content = re.sub(r'<([a-zA-Z0-9_]+)([^>]*)>([^<]*)<\/([a-zA-Z0-9_]+)([^>]*)>', 
-                         lambda m: f"<{m.group(1)}{m.group(2)}>{m.group(3)}</{m.group(1)}>",
-                         xml_content)
+    xml_content = _RE_GENERIC_TAG.sub(_fix_closing_tag, xml_content)
     
-    # Fix <Example> tags
-    xml_content = re.sub(r'</ Example>', '</Example>', xml_content)
+    # Fix the remaining known tag errors, spurious backslashes and "•.." in one pass
+    if suspicious:
+        xml_content = _RE_TAG_FIX.sub(_fix_known_tag, xml_content)
     
-    # Fix li tags
-    xml_content = re.sub(r'‹li>', '<li>', xml_content)
-    xml_content = re.sub(r'‹li\›', '<li>', xml_content)
-    xml_content = re.sub(r'\\li>', '</li>', xml_content)
-    xml_content = re.sub(r'‹/li>', '</li>', xml_content)
+    return xml_content
+
+# Parsers are reused across calls, one set per thread since lxml parsers aren't thread-safe
+_local = threading.local()
+
+def _get_parser(name, target_class=None):
+    """Return this thread's cached parser of the given name, creating it on first use
     
-    # Fix ul tags
-    xml_content = re.sub(r'‹ul>', '<ul>', xml_content)
-    xml_content = re.sub(r'‹/ul>', '</ul>', xml_content)
+    Parsers recover from errors and skip building the ID table, which nothing here uses.
+    """
+    parser = getattr(_local, name, None)
+    if parser is None:
+        target = target_class() if target_class else None
+        parser = etree.XMLParser(target=target, recover=True, huge_tree=True, collect_ids=False)
+        setattr(_local, name, parser)
+    return parser
+
+def is_valid_xml(xml_content):
+    """Check if XML is valid
     
-    # Fix Example tags
-    xml_content = re.sub(r'‹Example>', '<Example>', xml_content)
-    xml_content = re.sub(r'‹/Example>', '</Example>', xml_content)
-    xml_content = re.sub(r'</ Example>', '</Example>', xml_content)
+    The parser recovers from most errors instead of raising, so its error log is what
+    tells whether the document was actually well-formed.
+    """
+    if isinstance(xml_content, str):
+        xml_content = xml_content.encode()
+    try:
+        parser = _get_parser("validator")
+        etree.fromstring(xml_content, parser)
+    except XMLSyntaxError as e:
+        return False, str(e)
+    error_log = parser.error_log.filter_from_errors()
+    if error_log:
+        return False, str(error_log[0])
+    return True, ""
+
+class _GroupingBuilder:
+    """Base lxml parser target that groups each element's child values by tag
     
-    # Fix Example1 and Example2 tags
-    xml_content = re.sub(r'‹Example1>', '<Example1>', xml_content)
-    xml_content = re.sub(r'‹/Example1>', '</Example1>', xml_content)
-    xml_content = re.sub(r'‹Example2>', '<Example2>', xml_content)
-    xml_content = re.sub(r'‹/Example2>', '</Example2>', xml_content)
+    Subclasses turn the stripped text of a leaf element, or the grouped values of an
+    element with children, into the value for that element; text mixed in with child
+    elements is dropped.
+    """
     
-    # Fix transcript and output tags
-    xml_content = re.sub(r'‹transcript>', '<transcript>', xml_content)
-    xml_content = re.sub(r'‹output>', '<output>', xml_content)
+    def __init__(self):
+        self.tags = []
+        self.stack = []
+        self.text = []
+        self.root = None
     
-    # Fix system instruction tag
-    xml_content = re.sub(r'<system instruction>', '<system_instruction>', xml_content)
-    xml_content = re.sub(r'</system instruction›', '</system_instruction>', xml_content)
+    def start(self, tag, attrib):
+        # Children are grouped by tag, created once the element's first child is attached
+        self.tags.append(tag)
+        self.stack.append(None)
+        self.text.append([])
     
-    # Fix Task Instruction tag
-    xml_content = re.sub(r'<Task Instruction>', '<Task_Instruction>', xml_content)
-    xml_content = re.sub(r'</Task Instruction>', '</Task_Instruction>', xml_content)
+    def data(self, data):
+        # Tails and mixed-in text of elements that already have children would only be dropped
+        if self.stack[-1] is None:
+            self.text[-1].append(data)
     
-    # Fix intent taxonomy tag
-    xml_content = re.sub(r'‹intent taxonomy Instruction>', '<intent_taxonomy_Instruction>', xml_content)
-    xml_content = re.sub(r'</intent taxonomy Instruction>', '</intent_taxonomy_Instruction>', xml_content)
+    def end(self, tag):
+        self.tags.pop()
+        grouped = self.stack.pop()
+        text = self.text.pop()
+        
+        # Text content only matters for elements without children
+        if grouped is None:
+            result = self.leaf("".join(text).strip())
+        else:
+            result = self.mapping(grouped)
+        
+        if not self.stack:
+            self.root = result
+            return
+        
+        parent = self.stack[-1]
+        if parent is None:
+            parent = self.stack[-1] = defaultdict(list)
+            # The parent's own text is no longer needed either
+            self.text[-1] = None
+        parent[tag].append(result)
     
-    # Fix intent taxonomy list tag
-    xml_content = re.sub(r'<intent taxonomy list>', '<intent_taxonomy_list>', xml_content)
-    xml_content = re.sub(r'</intent taxonomy list>', '</intent_taxonomy_list>', xml_content)
+    def close(self):
+        # In recover mode libxml2 sends no end events for elements still open at EOF,
+        # so close them here like the tree parser would
+        while self.tags:
+            self.end(self.tags[-1])
+        
+        # Reset so the parser (and this target) can be reused; lxml calls close even on errors
+        root = self.root
+        self.tags, self.stack, self.text, self.root = [], [], [], None
+        return root
+
+class DictBuilder(_GroupingBuilder):
+    """lxml parser target that builds the clean dictionary straight from parse events
     
-    # Remove spurious backslashes
-    xml_content = xml_content.replace("\\", "")
+    Leaf elements become their stripped text, other elements become a mapping of
+    child tag to value.
+    """
     
-    # Fix other special characters
-    xml_content = xml_content.replace("•..", "")
+    def leaf(self, text):
+        return text if text else {}
     
-    return xml_content
+    def mapping(self, grouped):
+        # Repeated tags become a list, single ones stay scalar
+        return {child: items[0] if len(items) == 1 else items for child, items in grouped.items()}
 
-def is_valid_xml(xml_content):
-    """Check if XML is valid"""
-    try:
-        parser = etree.XMLParser(recover=True)
-        etree.parse(StringIO(xml_content), parser)
-        return True, ""
-    except XMLSyntaxError as e:
-        return False, str(e)
+def _scalar_event(value):
+    """YAML event for a string, quoted by the emitter when it would otherwise read as another type"""
+    implicit = _RESOLVER.resolve(yaml.ScalarNode, value, (True, False)) == _STR_TAG
+    return yaml.ScalarEvent(None, _STR_TAG, (implicit, True), value, style=_scalar_style(value))
 
-def xml_to_dict(xml_content):
-    """Convert XML to Python dictionary"""
-    parser = etree.XMLParser(recover=True)
-    root = etree.fromstring(xml_content.encode(), parser)
+class YamlEventBuilder(_GroupingBuilder):
+    """lxml parser target that turns parse events straight into YAML events
     
-    def element_to_dict(element):
-        result = {}
-        
-        # Process text content
-        if element.text and element.text.strip():
-            text = element.text.strip()
-            if not list(element):  # If no children elements
-                return text
-            else:
-                result["_text"] = text
-        
-        # Process child elements
-        for child in element:
-            child_dict = element_to_dict(child)
-            tag = child.tag
+    Yields the same document as DictBuilder followed by dict_to_yaml, without the
+    dictionary or PyYAML's representer and serializer passes in between. Each value
+    is a list of events in which nested lists are the values of child elements.
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.keys = {}
+    
+    def leaf(self, text):
+        if text:
+            return [_scalar_event(text)]
+        return [yaml.MappingStartEvent(None, _MAP_TAG, True, flow_style=False), yaml.MappingEndEvent()]
+    
+    def mapping(self, grouped):
+        events = [yaml.MappingStartEvent(None, _MAP_TAG, True, flow_style=False)]
+        for child, items in grouped.items():
+            # Key events are never modified, so one per distinct tag is enough
+            key = self.keys.get(child)
+            if key is None:
+                key = self.keys[child] = _scalar_event(child)
+            events.append(key)
             
-            # Handle multiple elements with the same tag
-            if tag in result:
-                if isinstance(result[tag], list):
-                    result[tag].append(child_dict)
-                else:
-                    result[tag] = [result[tag], child_dict]
+            # Repeated tags become a sequence, single ones stay scalar
+            if len(items) == 1:
+                events.append(items[0])
             else:
-                result[tag] = child_dict
-            
-            # Process tail text if present
-            if child.tail and child.tail.strip():
-                if "_tail" not in result:
-                    result["_tail"] = []
-                result["_tail"].append(child.tail.strip())
-        
-        return result
+                events.append(yaml.SequenceStartEvent(None, _SEQ_TAG, True, flow_style=False))
+                events.extend(items)
+                events.append(yaml.SequenceEndEvent())
+        events.append(yaml.MappingEndEvent())
+        return events
     
-    return element_to_dict(root)
+    def close(self):
+        self.keys = {}
+        return super().close()
 
-def dict_to_yaml(data_dict):
-    """Convert dictionary to YAML string"""
-    return yaml.dump(data_dict, default_flow_style=False, sort_keys=False, allow_unicode=True)
+def _iter_events(events):
+    """Flatten the nested event lists built by YamlEventBuilder"""
+    stack = [iter(events)]
+    while stack:
+        for event in stack[-1]:
+            if isinstance(event, list):
+                stack.append(iter(event))
+                break
+            yield event
+        else:
+            stack.pop()
 
-def clean_dict(d):
-    """Clean dictionary by removing unnecessary keys and normalizing values"""
-    if isinstance(d, dict):
-        # Remove internal keys
-        result = {k: clean_dict(v) for k, v in d.items() if not k.startswith('_')}
-        
-        # If dictionary is empty after cleaning, check if we had text content
-        if not result and '_text' in d:
-            return d['_text']
-        return result
-    elif isinstance(d, list):
-        return [clean_dict(item) for item in d]
-    else:
-        return d
+def _parse(xml_content, target_class=DictBuilder):
+    """Parse XML bytes into the target's result, returning it along with the parser's errors
+    
+    Warnings (e.g. a relative namespace URI) are left out, they don't make the document broken.
+    """
+    parser = _get_parser(target_class.__name__, target_class)
+    result = etree.fromstring(xml_content, parser)
+    return result, parser.error_log.filter_from_errors()
+
+def _report_errors(error_log):
+    """Warn about problems the parser had to recover from"""
+    if error_log:
+        print(f"Warning: XML still has issues: {error_log[0]}")
+        print("Attempting to continue with recovery mode...")
+
+def xml_to_dict(xml_content):
+    """Convert XML to a clean Python dictionary
+    
+    The parser feeds a DictBuilder directly, so no DOM is built along the way.
+    """
+    if isinstance(xml_content, str):
+        xml_content = xml_content.encode()
+    result, error_log = _parse(xml_content)
+    _report_errors(error_log)
+    return result
+
+def _wrap_root(xml_content):
+    """Wrap content with a root element if it doesn't start with one"""
+    if not _RE_LEADING_TAG.match(xml_content):
+        return b"<root>" + xml_content + b"</root>"
+    return xml_content
+
+def dict_to_yaml(data_dict, stream=None):
+    """Convert dictionary to YAML
+    
+    Returns the YAML string, or writes it to stream and returns None when a stream is given.
+    """
+    return yaml.dump(data_dict, stream, Dumper=_PromptDumper, default_flow_style=False, sort_keys=False,
+                     allow_unicode=True, explicit_end=not isinstance(data_dict, (dict, list)) and _ends_open(data_dict))
+
+def _emit_yaml(events, stream=None):
+    """Emit the events built by YamlEventBuilder as a YAML document
+    
+    Returns the YAML string, or writes it to stream and returns None when a stream is given.
+    """
+    if events is None:
+        # Nothing was parsed, same as dumping None
+        events = [yaml.ScalarEvent(None, _NULL_TAG, (True, False), "null")]
+    
+    output = StringIO() if stream is None else stream
+    dumper = _PromptDumper(output, default_flow_style=False, allow_unicode=True)
+    try:
+        dumper.emit(yaml.StreamStartEvent())
+        dumper.emit(yaml.DocumentStartEvent(explicit=False))
+        for event in _iter_events(events):
+            dumper.emit(event)
+        root = events[0]
+        explicit = isinstance(root, yaml.ScalarEvent) and _ends_open(None if root.tag == _NULL_TAG else root.value)
+        dumper.emit(yaml.DocumentEndEvent(explicit=explicit))
+        dumper.emit(yaml.StreamEndEvent())
+    finally:
+        dumper.dispose()
+    
+    if stream is None:
+        return output.getvalue()
 
 def process_xml_to_yaml(xml_content, output_file=None):
     """Main function to process XML and convert to YAML
     
     Args:
-        xml_content (str): XML content to process
+        xml_content (str or bytes): XML content to process, bytes are expected to be UTF-8
         output_file (str, optional): Path to save the YAML output. If None, doesn't save to file.
         
     Returns:
-        tuple: (fixed_xml, yaml_output)
+        tuple: (fixed_xml, yaml_output), fixed_xml has the same type as xml_content.
+            When output_file is given the YAML is streamed to it and yaml_output is None.
     """
-    # First, fix broken tags
-    fixed_xml = fix_broken_tags(xml_content)
+    # Work on bytes throughout, encoding only once
+    is_text = isinstance(xml_content, str)
+    if is_text:
+        xml_content = xml_content.encode()
     
-    # Wrap with root element if needed
-    if not fixed_xml.strip().startswith('<?xml') and not re.match(r'^\s*<\w+', fixed_xml):
-        fixed_xml = f"<root>{fixed_xml}</root>"
+    # First, apply the cheap fixes and wrap with root element if needed
+    fixed_xml = _wrap_root(_fix_fast(xml_content))
     
-    # Check if XML is valid
-    is_valid, error_msg = is_valid_xml(fixed_xml)
-    if not is_valid:
-        print(f"Warning: XML still has issues: {error_msg}")
-        print("Attempting to continue with recovery mode...")
-    
-    # Convert to dictionary
+    # Convert straight to YAML events
     try:
-        xml_dict = xml_to_dict(fixed_xml)
-        # Clean the dictionary
-        xml_dict = clean_dict(xml_dict)
-        # Convert to YAML
-        yaml_output = dict_to_yaml(xml_dict)
+        events, error_log = _parse(fixed_xml, YamlEventBuilder)
+        
+        # Only documents that are still broken pay for the full tag repair
+        if error_log:
+            fixed_xml = _wrap_root(fix_broken_tags(xml_content))
+            events, error_log = _parse(fixed_xml, YamlEventBuilder)
+        _report_errors(error_log)
         
-        # Save to file if output_file is provided
+        # Stream to file if output_file is provided, otherwise emit a YAML string
         if output_file:
             with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(yaml_output)
+                yaml_output = _emit_yaml(events, f)
             print(f"YAML output saved to {output_file}")
-            
-        return fixed_xml, yaml_output
+        else:
+            yaml_output = _emit_yaml(events)
     except Exception as e:
-        return fixed_xml, f"Error during conversion: {str(e)}"
+        yaml_output = f"Error during conversion: {str(e)}"
+    
+    if is_text:
+        fixed_xml = fixed_xml.decode()
+    return fixed_xml, yaml_output
 
 # Example usage
 if __name__ == "__main__":